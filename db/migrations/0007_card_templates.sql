@@ -36,6 +36,6 @@ CREATE TABLE IF NOT EXISTS server_settings (
 );
 
 -- Indexes for performance
-CREATE INDEX IF NOT EXISTS idx_card_templates_deck ON card_templates(deck_id);
+-- card_templates lookups by deck use idx_card_templates_deck_order (0013)
 CREATE INDEX IF NOT EXISTS idx_card_template_fields_card ON card_template_fields(card_id);
 CREATE INDEX IF NOT EXISTS idx_card_template_fields_template ON card_template_fields(template_id);
@@ -0,0 +1,12 @@
+-- Migration 0013: Covering index for deck template lookups
+-- Lets the web portal read a deck's template ids in field order from the index alone
+
+CREATE INDEX IF NOT EXISTS idx_card_templates_deck_order
+    ON card_templates(deck_id, field_order) INCLUDE (template_id);
+
+-- The covering index serves every lookup the plain deck_id index did
+DROP INDEX IF EXISTS idx_card_templates_deck;
+
+-- card_template_fields lookups by card are already served by the UNIQUE(card_id, template_id)
+-- index. field_value is deliberately not INCLUDEd: it is unbounded TEXT, and values larger
+-- than a btree entry can hold would make inserts fail.
@@ -1,29 +1,30 @@
 # main.py — updated with Marketplace, set-public, and adopt endpoints
 import os
 import asyncio
+import hashlib
+import jinja2
+import orjson
+import math
 import asyncpg
 import secrets
+import time
 from fastapi import FastAPI, Request, Depends, HTTPException, Form, Response
-from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from authlib.integrations.starlette_client import OAuth
-from starlette.middleware.sessions import SessionMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 import httpx
 from typing import Optional, Dict, List
 from datetime import datetime, timedelta
+from urllib.parse import quote, urlencode
 from object_storage import ObjectStorageService
 from fastapi.staticfiles import StaticFiles as BaseStaticFiles
 
 # Initialize FastAPI app
-app = FastAPI(title="DeckForge Admin Portal")
-
-# Add session middleware for OAuth with proper cookie settings for iframe
-app.add_middleware(
-    SessionMiddleware, 
-    secret_key=os.getenv("SESSION_SECRET", "your-secret-key-change-in-production"),
-    same_site="none",  # Required for iframe/webview context
-    https_only=True    # Required when using SameSite=None
-)
+app = FastAPI(title="DeckForge Admin Portal", default_response_class=ORJSONResponse)
+
+# Compress rendered pages, JSON and CSS. Card images are redirects to signed
+# storage URLs, so no already-compressed bodies pass through here.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
 
 # Mount static files and templates with no-cache headers
 
@@ -45,36 +46,167 @@ class NoCacheStaticFiles(BaseStaticFiles):
         await super().__call__(scope, receive, send_wrapper)
 
 app.mount("/static", NoCacheStaticFiles(directory="web/static"), name="static")
-templates = Jinja2Templates(directory="web/templates")
-
-# Discord OAuth2 configuration
-oauth = OAuth()
-oauth.register(
-    name='discord',
-    client_id=os.getenv('DISCORD_CLIENT_ID'),
-    client_secret=os.getenv('DISCORD_CLIENT_SECRET'),
-    authorize_url='https://discord.com/api/oauth2/authorize',
-    authorize_params=None,
-    access_token_url='https://discord.com/api/oauth2/token',
-    access_token_params=None,
-    refresh_token_url=None,
-    redirect_uri=os.getenv('DISCORD_REDIRECT_URI', 'http://localhost:5000/auth/callback'),
-    client_kwargs={'scope': 'identify guilds'},
+
+# Templates are only re-checked on disk in development. In production they are
+# compiled once per process, and the bytecode cache lets restarted workers skip
+# compiling them again.
+jinja_env = jinja2.Environment(
+    loader=jinja2.FileSystemLoader("web/templates"),
+    autoescape=jinja2.select_autoescape(),
+    auto_reload=os.getenv("ENV") == "dev",
+    cache_size=-1,
+    bytecode_cache=jinja2.FileSystemBytecodeCache(),
 )
+templates = Jinja2Templates(env=jinja_env)
+
+# Templates for the deck editor pages, compiled once at import and rendered
+# directly instead of being looked up on every request (see page_template)
+EDIT_CARD_TEMPLATE = templates.get_template("edit_card.html")
+EDIT_COOLDOWN_TEMPLATE = templates.get_template("edit_cooldown.html")
+EDIT_RARITY_TEMPLATE = templates.get_template("edit_rarity.html")
+DASHBOARD_TEMPLATE = templates.get_template("dashboard.html")
+EDIT_DECK_TEMPLATE = templates.get_template("edit_deck.html")
+
+# Helper: Get a preloaded page template. In development it is looked up again
+# so edits on disk show up without restarting the server.
+def page_template(template: jinja2.Template) -> jinja2.Template:
+    """Return the template, reloaded from disk if auto_reload is on"""
+    if jinja_env.auto_reload:
+        return jinja_env.get_template(template.name)
+    return template
+
+# Discord OAuth2 configuration, read once at import. startup() refuses to run
+# without a client ID and secret instead of failing on the first login.
+DISCORD_CLIENT_ID = os.getenv('DISCORD_CLIENT_ID')
+DISCORD_CLIENT_SECRET = os.getenv('DISCORD_CLIENT_SECRET')
+DISCORD_REDIRECT_URI = os.getenv('DISCORD_REDIRECT_URI', 'http://localhost:5000/auth/callback')
+# Everything in the authorize URL except the per-login state
+DISCORD_AUTHORIZE_URL = "https://discord.com/api/oauth2/authorize?" + urlencode({
+    'client_id': DISCORD_CLIENT_ID or '',
+    'redirect_uri': DISCORD_REDIRECT_URI,
+    'response_type': 'code',
+    'scope': 'identify guilds',
+}, quote_via=quote)
+
+# Hot statements shared by the session lookup and the deck editing handlers.
+# They are loaded into asyncpg's statement cache when the pool opens a
+# connection, so requests landing on a cold connection skip the parse/plan
+# step. They name their columns so the cached plans don't change shape when a
+# table gains one.
+SQL_SESSION_USER = """SELECT user_id, username, discriminator, avatar, access_token
+                      FROM user_sessions WHERE session_id = $1 AND expires_at > NOW()"""
+SQL_DECK_OWNERS = "SELECT deck_id, created_by FROM decks WHERE deck_id = ANY($1::int[])"
+SQL_DECK_BY_ID = """SELECT deck_id, name, created_by, free_pack_cooldown_hours
+                    FROM decks WHERE deck_id = $1"""
+SQL_DECK_TEMPLATE_IDS = "SELECT template_id FROM card_templates WHERE deck_id = $1"
+SQL_CARD_FIELD_VALUES = "SELECT template_id, field_value FROM card_template_fields WHERE card_id = $1"
+
+# Dashboard queries. The deck list doesn't depend on the user's guilds, so it
+# runs while the guilds are still being fetched from Discord.
+#   decks:  $1 = user id, $2 = is global admin
+#   guilds: $1 = user id, $2 = managed guild ids, in the order they are shown
+# Adopted decks are decks assigned to the user's servers but created by others
+# (a JSON array of the fields the dashboard shows, or NULL when empty). The
+# other guild columns line up with $2: each guild's assigned deck and mission
+# settings, NULL if unset. Both queries name their columns rather than
+# aggregating whole rows, so a migration on decks can't invalidate them.
+SQL_DASHBOARD_DECKS = """
+    SELECT deck_id, name, created_at FROM decks
+     WHERE created_by = $1 OR $2
+     ORDER BY created_at DESC
+"""
+SQL_DASHBOARD_GUILDS = """
+    SELECT
+        (SELECT json_agg(json_build_object('deck_id', d.deck_id, 'name', d.name, 'created_by', d.created_by)
+                         ORDER BY d.name)
+           FROM decks d
+          WHERE d.created_by IS DISTINCT FROM $1
+            AND d.deck_id IN (SELECT deck_id FROM server_decks WHERE guild_id = ANY($2::bigint[]))) AS adopted_decks,
+        array_agg(sd.deck_id ORDER BY g.ord) AS deck_ids,
+        array_agg(ms.mission_channel_id ORDER BY g.ord) AS mission_channel_ids,
+        array_agg(COALESCE(ms.missions_enabled, FALSE) ORDER BY g.ord) AS missions_enabled
+      FROM unnest($2::bigint[]) WITH ORDINALITY AS g(guild_id, ord)
+      LEFT JOIN server_decks sd ON sd.guild_id = g.guild_id
+      LEFT JOIN server_mission_settings ms ON ms.guild_id = g.guild_id
+"""
+
+# Each hot statement with arguments that match no rows
+HOT_STATEMENTS = (
+    (SQL_SESSION_USER, ('',)),
+    (SQL_DECK_OWNERS, ([],)),
+    (SQL_DECK_BY_ID, (0,)),
+    (SQL_DECK_TEMPLATE_IDS, (0,)),
+    (SQL_CARD_FIELD_VALUES, (0,)),
+)
+
+async def init_connection(conn: asyncpg.Connection):
+    """Pool init callback for new connections"""
+    # Running a statement once caches it on the connection. Unlike prepare(),
+    # cached statements stay valid after the connection is released back to
+    # the pool. Warming is best effort: if it fails (e.g. the bot hasn't run
+    # migrations yet on a fresh database) the connection is still usable.
+    if DB_STATEMENT_CACHE_SIZE:
+        try:
+            for sql, args in HOT_STATEMENTS:
+                await conn.fetch(sql, *args)
+        except asyncpg.PostgresError as e:
+            print(f"Skipping statement cache warm-up: {e}")
+
+# Database connection pool. Set DB_STATEMENT_CACHE_SIZE=0 when running behind
+# PgBouncer in transaction mode, which can't keep prepared statements.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "10"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "50"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "1024"))
+# Seconds a request waits for a free connection before giving up with a 503
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "2.0"))
 
-# Database connection pool
 db_pool: Optional[asyncpg.Pool] = None
+db_pool_lock = asyncio.Lock()
+
+# Shared client for Discord API calls, so connections stay warm between requests.
+# Requests use paths relative to https://discord.com/api.
+discord_client: Optional[httpx.AsyncClient] = None
+
+def get_discord_client() -> httpx.AsyncClient:
+    """Get the shared Discord API client"""
+    global discord_client
+    if discord_client is None:
+        discord_client = httpx.AsyncClient(
+            base_url="https://discord.com/api",
+            timeout=10.0,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            headers={"User-Agent": "DeckForge"}
+        )
+    return discord_client
+
+# Shared object storage service, created on first use so a missing
+# PRIVATE_OBJECT_DIR only fails the image endpoints
+storage_service: Optional[ObjectStorageService] = None
+
+def get_object_storage() -> ObjectStorageService:
+    """Get the shared object storage service (ValueError if not configured)"""
+    global storage_service
+    if storage_service is None:
+        storage_service = ObjectStorageService()
+    return storage_service
 
 async def get_db_pool():
     """Get database connection pool"""
     global db_pool
     if db_pool is None:
-        db_pool = await asyncpg.create_pool(
-            os.getenv("DATABASE_URL"),
-            min_size=2,
-            max_size=10,
-            command_timeout=60
-        )
+        # Only one task creates the pool; the rest wait and reuse it
+        async with db_pool_lock:
+            if db_pool is None:
+                db_pool = await asyncpg.create_pool(
+                    os.getenv("DATABASE_URL"),
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    max_inactive_connection_lifetime=300,
+                    command_timeout=60,
+                    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                    max_cached_statement_lifetime=0,
+                    init=init_connection
+                )
     return db_pool
 
 # Helper: Get current user from session cookie + database
@@ -84,63 +216,304 @@ async def get_current_user(request: Request) -> Optional[Dict]:
     if not session_id:
         return None
     
+    user = session_cache.get(session_id)
+    if user is not CACHE_MISS:
+        return user
+    
     pool = await get_db_pool()
-    async with pool.acquire() as conn:
-        session = await conn.fetchrow(
-            "SELECT * FROM user_sessions WHERE session_id = $1 AND expires_at > NOW()",
-            session_id
-        )
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        session = await conn.fetchrow(SQL_SESSION_USER, session_id)
         if session:
-            return {
+            user = {
                 'id': session['user_id'],
                 'username': session['username'],
                 'discriminator': session['discriminator'],
                 'avatar': session['avatar'],
                 'access_token': session['access_token']
             }
+            session_cache.set(session_id, user)
+            return user
     return None
 
+# Global admin user IDs, parsed once at startup
+ADMIN_IDS = frozenset(
+    int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").split(",") if admin_id.strip()
+)
+
 # Helper: Check if user is global admin
 def is_global_admin(user_id: int) -> bool:
     """Check if user is a global admin"""
-    admin_ids_str = os.getenv("ADMIN_IDS", "")
-    if not admin_ids_str:
-        return False
-    admin_ids = [int(id.strip()) for id in admin_ids_str.split(",") if id.strip()]
-    return user_id in admin_ids
+    return user_id in ADMIN_IDS
+
+CACHE_MISS = object()
+
+class TTLCache:
+    """
+    Small in-process cache with a fixed per-entry TTL.
+    When full, the least recently used entry is evicted to make room.
+    """
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: Dict = {}
+
+    def get(self, key, default=CACHE_MISS):
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return default
+        # Move the hit to the end so eviction drops cold entries first
+        self._entries[key] = self._entries.pop(key)
+        return entry[0]
+
+    def set(self, key, value):
+        self._entries.pop(key, None)
+        if len(self._entries) >= self.maxsize:
+            del self._entries[next(iter(self._entries))]
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def pop(self, key):
+        self._entries.pop(key, None)
+
+# Session cache: session_id -> user. Every authenticated request looks up its
+# session, so valid sessions are kept briefly instead of hitting the database.
+# Logout drops the entry here; other worker processes may still accept the
+# session until their copy expires.
+SESSION_CACHE_TTL = 30
+SESSION_CACHE_SIZE = 10000
+session_cache = TTLCache(SESSION_CACHE_TTL, SESSION_CACHE_SIZE)
+
+# Deck ownership cache: deck_id -> created_by. Ownership is never changed by
+# the portal, so a short TTL is enough to pick up outside edits.
+DECK_OWNER_CACHE_TTL = 60
+DECK_OWNER_CACHE_SIZE = 1024
+deck_owner_cache = TTLCache(DECK_OWNER_CACHE_TTL, DECK_OWNER_CACHE_SIZE)
+
+def cache_deck_owner(deck_id: int, created_by: Optional[int]):
+    """Remember a deck's owner"""
+    deck_owner_cache.set(deck_id, created_by)
+
+def invalidate_deck_owner(deck_id: int):
+    """Drop a deck from the ownership cache"""
+    deck_owner_cache.pop(deck_id)
+
+class DeckOwnerLoader:
+    """
+    Coalesces concurrent deck ownership lookups into one query.
+    Requests arriving within `delay` seconds of each other share a single
+    SELECT ... WHERE deck_id = ANY($1) round-trip.
+    """
+
+    def __init__(self, delay: float = 0.002):
+        self.delay = delay
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def load(self, deck_id: int) -> tuple:
+        """Get (deck_found, created_by) for a deck"""
+        future = self._pending.get(deck_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[deck_id] = future
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush())
+        # Shield so one cancelled request doesn't cancel the lookup for the others
+        return await asyncio.shield(future)
+
+    def _take_pending(self) -> Dict[int, asyncio.Future]:
+        """Detach the current batch so new lookups start another flush"""
+        pending, self._pending = self._pending, {}
+        self._flush_task = None
+        return pending
+
+    async def _flush(self):
+        """Run one query for every deck requested since the last flush"""
+        pending = None
+        try:
+            await asyncio.sleep(self.delay)
+            pending = self._take_pending()
+            pool = await get_db_pool()
+            async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+                rows = await conn.fetch(SQL_DECK_OWNERS, list(pending))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except BaseException:
+            # Cancelled (e.g. at shutdown): cancel the waiters instead of
+            # leaving them hanging, then let the cancellation through
+            if pending is None:
+                pending = self._take_pending()
+            for future in pending.values():
+                future.cancel()
+            raise
+        
+        owners = {row['deck_id']: row['created_by'] for row in rows}
+        for deck_id, future in pending.items():
+            if not future.done():
+                future.set_result((deck_id in owners, owners.get(deck_id)))
+
+deck_owner_loader = DeckOwnerLoader()
+
+# Helper: Verify the user may edit a deck
+async def require_deck_owner(deck_id: int, user: Dict):
+    """Raise 404 if the deck doesn't exist, 403 if the user doesn't own it"""
+    # Call this before acquiring a connection: the loader acquires its own
+    owner = deck_owner_cache.get(deck_id)
+    if owner is CACHE_MISS:
+        deck_found, owner = await deck_owner_loader.load(deck_id)
+        
+        if not deck_found:
+            invalidate_deck_owner(deck_id)
+            raise HTTPException(status_code=404, detail="Deck not found")
+        
+        cache_deck_owner(deck_id, owner)
+    
+    if owner != user['id'] and not is_global_admin(user['id']):
+        raise HTTPException(status_code=403, detail="You don't own this deck")
+
+# Discord permission bit for "Manage Server"
+MANAGE_GUILD = 0x20
+
+# Managed guild cache: sha256(access_token) -> managed guilds. Every admin
+# page needs the user's guilds, so this spares a Discord round-trip per request.
+GUILD_CACHE_TTL = 60
+GUILD_CACHE_SIZE = 1024
+guild_cache = TTLCache(GUILD_CACHE_TTL, GUILD_CACHE_SIZE)
+# Discord lookups in flight, by cache key. Concurrent misses for the same
+# token (e.g. several tabs loading at once) wait on one request.
+_guild_fetches: Dict[str, asyncio.Task] = {}
 
 # Helper: Get user's managed guilds from Discord API
 async def get_user_managed_guilds(access_token: str) -> List[Dict]:
-    """Fetch guilds where user has MANAGE_SERVER permission"""
+    """Fetch guilds where user has MANAGE_SERVER permission, cached briefly"""
     if not access_token:
         return []
     
-    async with httpx.AsyncClient() as client:
-        headers = {'Authorization': f'Bearer {access_token}'}
-        
-        try:
-            response = await client.get('https://discord.com/api/users/@me/guilds', headers=headers, timeout=10.0)
-            
-            if response.status_code == 429:
-                # Rate limited - wait and retry once
-                retry_after = response.json().get('retry_after', 1)
-                await asyncio.sleep(retry_after)
-                response = await client.get('https://discord.com/api/users/@me/guilds', headers=headers, timeout=10.0)
-            
-            if response.status_code != 200:
-                print(f"Discord API error: {response.status_code} - {response.text}")
-                return []
-            
-            guilds = response.json()
-            # Filter for guilds where user has MANAGE_GUILD permission (0x20)
-            managed_guilds = [
-                guild for guild in guilds
-                if int(guild.get('permissions', 0)) & 0x20
-            ]
-            return managed_guilds
-        except Exception as e:
-            print(f"Error fetching guilds: {e}")
-            return []
+    cache_key = hashlib.sha256(access_token.encode()).hexdigest()
+    managed_guilds = guild_cache.get(cache_key)
+    if managed_guilds is CACHE_MISS:
+        fetch = _guild_fetches.get(cache_key)
+        if fetch is None:
+            fetch = asyncio.ensure_future(load_user_managed_guilds(cache_key, access_token))
+            _guild_fetches[cache_key] = fetch
+            fetch.add_done_callback(lambda _: _guild_fetches.pop(cache_key, None))
+        # Shield so one cancelled request doesn't cancel the shared lookup
+        managed_guilds = await asyncio.shield(fetch)
+    return managed_guilds
+
+async def load_user_managed_guilds(cache_key: str, access_token: str) -> List[Dict]:
+    """Fetch managed guilds from Discord and cache them if the call succeeded"""
+    managed_guilds = await fetch_user_managed_guilds(access_token)
+    if managed_guilds is None:
+        return []
+    guild_cache.set(cache_key, managed_guilds)
+    return managed_guilds
+
+async def fetch_user_managed_guilds(access_token: str) -> Optional[List[Dict]]:
+    """Ask Discord for the user's managed guilds, or None if the call failed"""
+    client = get_discord_client()
+    headers = {'Authorization': f'Bearer {access_token}'}
+    
+    try:
+        response = await client.get('/users/@me/guilds', headers=headers)
+        
+        if response.status_code == 429:
+            # Rate limited - wait and retry once
+            retry_after = orjson.loads(response.content).get('retry_after', 1)
+            await asyncio.sleep(retry_after)
+            response = await client.get('/users/@me/guilds', headers=headers)
+        
+        if response.status_code != 200:
+            print(f"Discord API error: {response.status_code} - {response.text}")
+            return None
+        
+        # Filter for guilds where user has MANAGE_GUILD permission, keeping
+        # only the fields the portal shows so cached entries stay small.
+        # Discord always sends permissions (as a string) for this endpoint.
+        managed_guilds = [
+            {'id': guild['id'], 'name': guild['name'], 'icon': guild['icon']}
+            for guild in orjson.loads(response.content)
+            if int(guild['permissions']) & MANAGE_GUILD
+        ]
+        return managed_guilds
+    except Exception as e:
+        print(f"Error fetching guilds: {e}")
+        return None
+
+# Helper: Get the user's managed guilds once per request
+async def get_request_managed_guilds(request: Request, user: Dict) -> List[Dict]:
+    """Managed guilds for this request, shared by dependencies and the handler"""
+    managed_guilds = getattr(request.state, 'managed_guilds', None)
+    if managed_guilds is None:
+        managed_guilds = await get_user_managed_guilds(user.get('access_token', ''))
+        request.state.managed_guilds = managed_guilds
+        request.state.managed_guild_ids = frozenset(int(g['id']) for g in managed_guilds)
+    return managed_guilds
+
+async def get_request_managed_guild_ids(request: Request, user: Dict) -> frozenset:
+    """IDs of the managed guilds for this request, as ints"""
+    await get_request_managed_guilds(request, user)
+    return request.state.managed_guild_ids
+
+# Helper: Verify the user may change a guild's settings
+async def require_guild_manager(request: Request, guild_id: int, user: Dict):
+    """Raise 403 unless the user manages the guild or is a global admin"""
+    # Global admins may manage any guild, so they don't need a Discord lookup.
+    # Callers depend on require_admin, which sets request.state.is_admin.
+    if request.state.is_admin:
+        return
+    
+    if guild_id not in await get_request_managed_guild_ids(request, user):
+        raise HTTPException(status_code=403, detail="You don't manage this server")
+
+# Helper: Check the ownership columns returned by a guarded write. Guarded
+# writes select the deck's owner in a CTE and only modify rows when
+# "created_by = <user> OR <is global admin>", returning deck_found and owner so
+# the handler can still tell 404 from 403 without a separate lookup.
+def check_guarded_write(result, deck_id: int, user: Dict):
+    """Raise 404 if the deck doesn't exist, 403 if the user doesn't own it"""
+    if not result['deck_found']:
+        invalidate_deck_owner(deck_id)
+        raise HTTPException(status_code=404, detail="Deck not found")
+    
+    cache_deck_owner(deck_id, result['owner'])
+    if result['owner'] != user['id'] and not is_global_admin(user['id']):
+        raise HTTPException(status_code=403, detail="You don't own this deck")
+
+# Helper: Collect template_field_<id> form values, keyed by template_id. Keys
+# whose id isn't plain ASCII digits within the INTEGER range of template_id
+# can't name a template, so they are skipped.
+TEMPLATE_FIELD_PREFIX = 'template_field_'
+MAX_TEMPLATE_ID = 2**31 - 1
+
+def template_field_values(form_data) -> Dict[int, str]:
+    """Map template_id to submitted value for each template field in a form"""
+    provided = {}
+    for key, value in form_data.items():
+        if not key.startswith(TEMPLATE_FIELD_PREFIX):
+            continue
+        template_id = key[len(TEMPLATE_FIELD_PREFIX):]
+        if template_id.isascii() and template_id.isdigit() and int(template_id) <= MAX_TEMPLATE_ID:
+            provided[int(template_id)] = value
+    return provided
+
+# Helper: Send a form post back to the deck editor
+def redirect_to_deck_editor(deck_id: int) -> RedirectResponse:
+    """303 redirect to /deck/{deck_id}/edit"""
+    return RedirectResponse(url=f"/deck/{deck_id}/edit", status_code=303)
+
+# Helper: Send a rendered page with an ETag so browsers can revalidate it
+def etag_response(request: Request, html: str) -> Response:
+    """200 with the page, or 304 if the browser already has this exact page"""
+    etag = '"' + hashlib.blake2b(html.encode(), digest_size=16).hexdigest() + '"'
+    # no-cache: always revalidate, so a page is never stale after a form post
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(html, headers=headers)
 
 # Dependency: Require authentication
 async def require_auth(request: Request):
@@ -153,24 +526,74 @@ async def require_auth(request: Request):
 # Dependency: Require admin access
 async def require_admin(request: Request, user = Depends(require_auth)):
     """Dependency to require admin access"""
-    if not is_global_admin(user['id']):
+    # Handlers read the flag from request.state instead of checking again
+    request.state.is_admin = is_global_admin(user['id'])
+    if not request.state.is_admin:
         # Check if user manages any servers
-        managed_guilds = await get_user_managed_guilds(user.get('access_token', ''))
+        managed_guilds = await get_request_managed_guilds(request, user)
         if not managed_guilds:
             raise HTTPException(status_code=403, detail="Insufficient permissions")
     return user
 
+# Expired OAuth states (abandoned logins) and sessions are only removed on use
+# or logout, so sweep the rest periodically to keep both tables small
+EXPIRED_ROWS_CLEANUP_INTERVAL = 300
+cleanup_task: Optional[asyncio.Task] = None
+
+async def delete_expired_rows():
+    """Delete expired OAuth states and user sessions"""
+    pool = await get_db_pool()
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        # No arguments, so both statements go in one round-trip and one transaction
+        await conn.execute("""
+            DELETE FROM oauth_states WHERE expires_at <= NOW();
+            DELETE FROM user_sessions WHERE expires_at <= NOW();
+        """)
+
+async def cleanup_expired_rows_loop():
+    """Run delete_expired_rows every EXPIRED_ROWS_CLEANUP_INTERVAL seconds"""
+    while True:
+        await asyncio.sleep(EXPIRED_ROWS_CLEANUP_INTERVAL)
+        try:
+            await delete_expired_rows()
+        except Exception as e:
+            print(f"Error deleting expired sessions and OAuth states: {e}")
+
 @app.on_event("startup")
 async def startup():
-    """Initialize database pool on startup"""
+    """Initialize database pool, HTTP client and cleanup task on startup"""
+    global cleanup_task
+    if not DISCORD_CLIENT_ID or not DISCORD_CLIENT_SECRET:
+        raise RuntimeError("DISCORD_CLIENT_ID and DISCORD_CLIENT_SECRET must be set")
     await get_db_pool()
+    get_discord_client()
+    cleanup_task = asyncio.create_task(cleanup_expired_rows_loop())
 
 @app.on_event("shutdown")
 async def shutdown():
-    """Close database pool on shutdown"""
-    global db_pool
+    """Stop the cleanup task and close database pool and HTTP clients on shutdown"""
+    global db_pool, discord_client, cleanup_task, storage_service
+    if cleanup_task:
+        cleanup_task.cancel()
+        cleanup_task = None
     if db_pool:
         await db_pool.close()
+    if discord_client:
+        await discord_client.aclose()
+        discord_client = None
+    if storage_service:
+        await storage_service.aclose()
+        storage_service = None
+
+@app.exception_handler(asyncio.TimeoutError)
+async def timeout_handler(request: Request, exc: asyncio.TimeoutError):
+    """Fail fast with 503 when the pool is exhausted or a query times out"""
+    print(f"Database timeout on {request.url.path}")
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": "Server busy, please try again"},
+        headers={"Retry-After": "1"}
+    )
 
 # Routes
 @app.get("/", response_class=HTMLResponse)
@@ -189,25 +612,14 @@ async def login(request: Request):
     
     # Store state in database
     pool = await get_db_pool()
-    async with pool.acquire() as conn:
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         await conn.execute(
             "INSERT INTO oauth_states (state) VALUES ($1)",
             state
         )
     
-    # Build Discord OAuth URL with our state
-    redirect_uri = os.getenv('DISCORD_REDIRECT_URI')
-    client_id = os.getenv('DISCORD_CLIENT_ID')
-    oauth_url = (
-        f"https://discord.com/api/oauth2/authorize"
-        f"?client_id={client_id}"
-        f"&redirect_uri={redirect_uri}"
-        f"&response_type=code"
-        f"&scope=identify%20guilds"
-        f"&state={state}"
-    )
-    
-    return RedirectResponse(url=oauth_url)
+    # Build Discord OAuth URL with our state (token_urlsafe needs no quoting)
+    return RedirectResponse(url=f"{DISCORD_AUTHORIZE_URL}&state={state}")
 
 @app.get("/auth/callback")
 async def auth_callback(request: Request):
@@ -222,53 +634,51 @@ async def auth_callback(request: Request):
         
         # Verify state from database
         pool = await get_db_pool()
-        async with pool.acquire() as conn:
-            state_record = await conn.fetchrow(
-                "SELECT * FROM oauth_states WHERE state = $1 AND expires_at > NOW()",
+        async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+            # Consume the state in one statement so it can't be replayed
+            state_found = await conn.fetchval(
+                "DELETE FROM oauth_states WHERE state = $1 AND expires_at > NOW() RETURNING TRUE",
                 state
             )
             
-            if not state_record:
+            if not state_found:
                 print("OAuth error: Invalid or expired state")
                 return RedirectResponse(url="/?error=auth_failed")
-            
-            # Delete used state
-            await conn.execute("DELETE FROM oauth_states WHERE state = $1", state)
         
         # Exchange code for token
-        async with httpx.AsyncClient() as client:
-            token_response = await client.post(
-                'https://discord.com/api/oauth2/token',
-                data={
-                    'client_id': os.getenv('DISCORD_CLIENT_ID'),
-                    'client_secret': os.getenv('DISCORD_CLIENT_SECRET'),
-                    'grant_type': 'authorization_code',
-                    'code': code,
-                    'redirect_uri': os.getenv('DISCORD_REDIRECT_URI'),
-                },
-                headers={'Content-Type': 'application/x-www-form-urlencoded'}
-            )
-            
-            if token_response.status_code != 200:
-                print(f"Token exchange failed: {token_response.text}")
-                return RedirectResponse(url="/?error=auth_failed")
-            
-            token_data = token_response.json()
-            access_token = token_data['access_token']
-            
-            # Fetch user info
-            headers = {'Authorization': f'Bearer {access_token}'}
-            user_response = await client.get('https://discord.com/api/users/@me', headers=headers)
-            
-            if user_response.status_code != 200:
-                print(f"User fetch failed: {user_response.text}")
-                return RedirectResponse(url="/?error=auth_failed")
-            
-            user_data = user_response.json()
+        client = get_discord_client()
+        token_response = await client.post(
+            '/oauth2/token',
+            data={
+                'client_id': DISCORD_CLIENT_ID,
+                'client_secret': DISCORD_CLIENT_SECRET,
+                'grant_type': 'authorization_code',
+                'code': code,
+                'redirect_uri': DISCORD_REDIRECT_URI,
+            },
+            headers={'Content-Type': 'application/x-www-form-urlencoded'}
+        )
+        
+        if token_response.status_code != 200:
+            print(f"Token exchange failed: {token_response.text}")
+            return RedirectResponse(url="/?error=auth_failed")
+        
+        token_data = orjson.loads(token_response.content)
+        access_token = token_data['access_token']
+        
+        # Fetch user info
+        headers = {'Authorization': f'Bearer {access_token}'}
+        user_response = await client.get('/users/@me', headers=headers)
+        
+        if user_response.status_code != 200:
+            print(f"User fetch failed: {user_response.text}")
+            return RedirectResponse(url="/?error=auth_failed")
+        
+        user_data = orjson.loads(user_response.content)
         
         # Create session in database
         session_id = secrets.token_urlsafe(32)
-        async with pool.acquire() as conn:
+        async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
             await conn.execute(
                 """INSERT INTO user_sessions 
                    (session_id, user_id, username, discriminator, avatar, access_token)
@@ -304,8 +714,9 @@ async def logout(request: Request):
     """Logout user"""
     session_id = request.cookies.get('session_id')
     if session_id:
+        session_cache.pop(session_id)
         pool = await get_db_pool()
-        async with pool.acquire() as conn:
+        async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
             await conn.execute("DELETE FROM user_sessions WHERE session_id = $1", session_id)
     
     response = RedirectResponse(url="/")
@@ -316,78 +727,51 @@ async def logout(request: Request):
 async def dashboard(request: Request, user = Depends(require_admin)):
     """Main dashboard showing user's managed servers and decks"""
     pool = await get_db_pool()
+    is_admin = request.state.is_admin
     
-    # Get user's managed guilds
-    managed_guilds = await get_user_managed_guilds(user.get('access_token', ''))
+    async def load_decks():
+        async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+            return await conn.fetch(SQL_DASHBOARD_DECKS, user['id'], is_admin)
     
-    # Get deck assignments for these guilds
-    async with pool.acquire() as conn:
-        # Get all decks created by this user
-        user_decks = await conn.fetch(
-            "SELECT * FROM decks WHERE created_by = $1 ORDER BY created_at DESC",
-            user['id']
-        )
-        user_deck_ids = {d['deck_id'] for d in user_decks}
-        
-        # Get server-deck assignments
-        guild_ids = [int(g['id']) for g in managed_guilds]
-        server_decks = {}
-        adopted_deck_ids = set()
-        mission_settings = {}
-        if guild_ids:
-            assignments = await conn.fetch(
-                "SELECT guild_id, deck_id FROM server_decks WHERE guild_id = ANY($1)",
-                guild_ids
-            )
-            server_decks = {row['guild_id']: row['deck_id'] for row in assignments}
-            # Collect deck IDs that are adopted (assigned to user's servers but not created by user)
-            adopted_deck_ids = {row['deck_id'] for row in assignments if row['deck_id'] not in user_deck_ids}
-            
-            # Get mission channel settings
-            mission_rows = await conn.fetch(
-                "SELECT guild_id, mission_channel_id, missions_enabled FROM server_mission_settings WHERE guild_id = ANY($1)",
-                guild_ids
-            )
-            mission_settings = {row['guild_id']: {'channel_id': row['mission_channel_id'], 'enabled': row['missions_enabled']} for row in mission_rows}
-        
-        # Get adopted decks (assigned to user's servers but created by others)
-        adopted_decks = []
-        if adopted_deck_ids:
-            adopted_decks = await conn.fetch(
-                "SELECT * FROM decks WHERE deck_id = ANY($1) ORDER BY name",
-                list(adopted_deck_ids)
-            )
-        
-        # If global admin, show all decks
-        if is_global_admin(user['id']):
-            all_decks = await conn.fetch(
-                "SELECT * FROM decks ORDER BY created_at DESC"
-            )
-        else:
-            all_decks = user_decks
+    async def load_guilds():
+        managed_guilds = await get_request_managed_guilds(request, user)
+        if not managed_guilds:
+            return managed_guilds, None
+        guild_ids = [int(guild['id']) for guild in managed_guilds]
+        async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+            return managed_guilds, await conn.fetchrow(SQL_DASHBOARD_GUILDS, user['id'], guild_ids)
+    
+    # Load the deck list on one connection while the guilds are resolved and
+    # their assignments loaded on another
+    all_decks, (managed_guilds, guild_row) = await asyncio.gather(load_decks(), load_guilds())
     
-    # Combine guild info with deck assignments
+    # Global admins see all decks, everyone else sees the decks they created
+    adopted_decks = []
     guilds_with_decks = []
-    for guild in managed_guilds:
-        guild_id = int(guild['id'])
-        mission_info = mission_settings.get(guild_id, {})
-        guilds_with_decks.append({
-            'id': guild_id,
-            'name': guild['name'],
-            'icon': guild.get('icon'),
-            'deck_id': server_decks.get(guild_id),
-            'mission_channel_id': mission_info.get('channel_id'),
-            'missions_enabled': mission_info.get('enabled', False)
-        })
-    
-    return templates.TemplateResponse("dashboard.html", {
+    if guild_row:
+        if guild_row['adopted_decks']:
+            adopted_decks = orjson.loads(guild_row['adopted_decks'])
+        # Combine guild info with deck assignments (the arrays follow managed_guilds)
+        for guild, deck_id, mission_channel_id, missions_enabled in zip(
+            managed_guilds, guild_row['deck_ids'], guild_row['mission_channel_ids'], guild_row['missions_enabled']
+        ):
+            guilds_with_decks.append({
+                'id': int(guild['id']),
+                'name': guild['name'],
+                'icon': guild.get('icon'),
+                'deck_id': deck_id,
+                'mission_channel_id': mission_channel_id,
+                'missions_enabled': missions_enabled
+            })
+    
+    return etag_response(request, page_template(DASHBOARD_TEMPLATE).render({
         "request": request,
         "user": user,
         "guilds": guilds_with_decks,
-        "decks": [dict(d) for d in all_decks],
-        "adopted_decks": [dict(d) for d in adopted_decks],
-        "is_global_admin": is_global_admin(user['id'])
-    })
+        "decks": all_decks,
+        "adopted_decks": adopted_decks,
+        "is_global_admin": is_admin
+    }))
 
 @app.post("/server/{guild_id}/assign-deck")
 async def assign_deck_to_server(
@@ -400,13 +784,9 @@ async def assign_deck_to_server(
     pool = await get_db_pool()
     
     # Verify user manages this server
-    managed_guilds = await get_user_managed_guilds(user.get('access_token', ''))
-    guild_ids = [int(g['id']) for g in managed_guilds]
+    await require_guild_manager(request, guild_id, user)
     
-    if guild_id not in guild_ids and not is_global_admin(user['id']):
-        raise HTTPException(status_code=403, detail="You don't manage this server")
-    
-    async with pool.acquire() as conn:
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         if deck_id:
             # Assign or update deck
             await conn.execute(
@@ -431,44 +811,43 @@ async def get_server_channels(guild_id: int, user = Depends(require_admin)):
     if not bot_token:
         return {"channels": [], "error": "Bot token not configured"}
     
-    async with httpx.AsyncClient() as client:
-        for attempt in range(3):
-            try:
-                response = await client.get(
-                    f"https://discord.com/api/v10/guilds/{guild_id}/channels",
-                    headers={"Authorization": f"Bot {bot_token}"},
-                    timeout=10.0
-                )
-                
-                if response.status_code == 429:
-                    retry_after = response.json().get('retry_after', 1)
-                    await asyncio.sleep(min(retry_after + 0.5, 5))
-                    continue
-                
-                if response.status_code == 403:
-                    return {"channels": [], "error": "Bot does not have access to this server"}
-                
-                if response.status_code != 200:
-                    return {"channels": [], "error": f"Discord API error: {response.status_code}"}
-                
-                all_channels = response.json()
-                text_channels = [
-                    {"id": str(ch['id']), "name": ch['name']}
-                    for ch in all_channels
-                    if ch['type'] == 0
-                ]
-                
-                text_channels.sort(key=lambda x: x['name'])
-                
-                return {"channels": text_channels}
-                
-            except Exception as e:
-                if attempt < 2:
-                    await asyncio.sleep(1)
-                    continue
-                return {"channels": [], "error": str(e)}
-        
-        return {"channels": [], "error": "Rate limited, please try again"}
+    client = get_discord_client()
+    for attempt in range(3):
+        try:
+            response = await client.get(
+                f"/v10/guilds/{guild_id}/channels",
+                headers={"Authorization": f"Bot {bot_token}"}
+            )
+            
+            if response.status_code == 429:
+                retry_after = orjson.loads(response.content).get('retry_after', 1)
+                await asyncio.sleep(min(retry_after + 0.5, 5))
+                continue
+            
+            if response.status_code == 403:
+                return {"channels": [], "error": "Bot does not have access to this server"}
+            
+            if response.status_code != 200:
+                return {"channels": [], "error": f"Discord API error: {response.status_code}"}
+            
+            all_channels = orjson.loads(response.content)
+            text_channels = [
+                {"id": str(ch['id']), "name": ch['name']}
+                for ch in all_channels
+                if ch['type'] == 0
+            ]
+            
+            text_channels.sort(key=lambda x: x['name'])
+            
+            return {"channels": text_channels}
+            
+        except Exception as e:
+            if attempt < 2:
+                await asyncio.sleep(1)
+                continue
+            return {"channels": [], "error": str(e)}
+    
+    return {"channels": [], "error": "Rate limited, please try again"}
 
 @app.post("/server/{guild_id}/set-mission-channel")
 async def set_mission_channel(
@@ -480,13 +859,9 @@ async def set_mission_channel(
     """Set the mission channel for a server"""
     pool = await get_db_pool()
     
-    managed_guilds = await get_user_managed_guilds(user.get('access_token', ''))
-    guild_ids_list = [int(g['id']) for g in managed_guilds]
+    await require_guild_manager(request, guild_id, user)
     
-    if guild_id not in guild_ids_list and not is_global_admin(user['id']):
-        raise HTTPException(status_code=403, detail="You don't manage this server")
-    
-    async with pool.acquire() as conn:
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         channel_id_int = int(channel_id) if channel_id else None
         enabled = channel_id_int is not None
         
@@ -502,15 +877,13 @@ async def set_mission_channel(
     
     return RedirectResponse(url="/dashboard", status_code=303)
 
-@app.post("/api/images/upload-url")
-async def get_image_upload_url(request: Request, user = Depends(require_admin)):
-    """Get a presigned URL for uploading an image"""
-    file_extension = request.query_params.get("extension", "")
-    
+# Helper: Sign upload URLs for the upload endpoints, reporting storage
+# problems as HTTP errors
+async def create_upload_urls(count: int, file_extension: str) -> List[str]:
+    """Get `count` presigned upload URLs from object storage"""
     try:
-        storage = ObjectStorageService()
-        upload_url = await storage.get_upload_url(file_extension)
-        return {"uploadUrl": upload_url}
+        storage = get_object_storage()
+        return await storage.get_upload_urls(count, file_extension)
     except ValueError as e:
         # PRIVATE_OBJECT_DIR not set
         raise HTTPException(
@@ -524,6 +897,29 @@ async def get_image_upload_url(request: Request, user = Depends(require_admin)):
             detail=f"Image upload not configured: {str(e)}"
         )
 
+@app.post("/api/images/upload-url")
+async def get_image_upload_url(request: Request, user = Depends(require_admin)):
+    """Get a presigned URL for uploading an image"""
+    file_extension = request.query_params.get("extension", "")
+    upload_urls = await create_upload_urls(1, file_extension)
+    return {"uploadUrl": upload_urls[0]}
+
+# Most upload URLs signed by one /api/images/upload-urls request
+MAX_UPLOAD_URLS_PER_REQUEST = 100
+
+@app.post("/api/images/upload-urls")
+async def get_image_upload_urls(request: Request, count: int = 1, user = Depends(require_admin)):
+    """Get presigned URLs for uploading several images at once"""
+    if count < 1 or count > MAX_UPLOAD_URLS_PER_REQUEST:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Count must be between 1 and {MAX_UPLOAD_URLS_PER_REQUEST}"
+        )
+    
+    file_extension = request.query_params.get("extension", "")
+    upload_urls = await create_upload_urls(count, file_extension)
+    return {"uploadUrls": upload_urls}
+
 @app.post("/api/images/confirm")
 async def confirm_image_upload(
     request: Request,
@@ -532,7 +928,7 @@ async def confirm_image_upload(
 ):
     """Confirm image upload and return the image path for database storage"""
     try:
-        storage = ObjectStorageService()
+        storage = get_object_storage()
         image_path = storage.get_image_path(upload_url)
         return {"imagePath": image_path}
     except ValueError as e:
@@ -540,19 +936,33 @@ async def confirm_image_upload(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Image confirmation failed: {str(e)}")
 
+# Signed image URL cache: image_id -> signed GET URL. Object storage signs
+# them for an hour, so a cached URL always has at least 15 minutes left, which
+# also covers the browser caching the redirect for IMAGE_REDIRECT_MAX_AGE.
+IMAGE_URL_CACHE_TTL = 45 * 60
+IMAGE_URL_CACHE_SIZE = 10000
+IMAGE_REDIRECT_MAX_AGE = 5 * 60
+image_url_cache = TTLCache(IMAGE_URL_CACHE_TTL, IMAGE_URL_CACHE_SIZE)
+
 @app.get("/images/card-images/{image_id:path}")
 async def serve_card_image(image_id: str):
     """Serve uploaded card images from object storage"""
     try:
-        storage = ObjectStorageService()
-        image_path = f"/images/card-images/{image_id}"
-        
-        signed_url = await storage.get_image_url(image_path)
-        if not signed_url:
-            raise HTTPException(status_code=404, detail="Image not found")
+        signed_url = image_url_cache.get(image_id)
+        if signed_url is CACHE_MISS:
+            storage = get_object_storage()
+            image_path = f"/images/card-images/{image_id}"
+            
+            signed_url = await storage.get_image_url(image_path)
+            if not signed_url:
+                raise HTTPException(status_code=404, detail="Image not found")
+            image_url_cache.set(image_id, signed_url)
         
         # Redirect to the signed URL
-        return RedirectResponse(url=signed_url)
+        return RedirectResponse(
+            url=signed_url,
+            headers={"Cache-Control": f"private, max-age={IMAGE_REDIRECT_MAX_AGE}"}
+        )
     except ValueError:
         # PRIVATE_OBJECT_DIR not set
         raise HTTPException(status_code=500, detail="Object storage not configured")
@@ -564,18 +974,17 @@ async def serve_card_image(image_id: str):
 async def marketplace(request: Request, user = Depends(require_auth)):
     """Show public decks available for adoption"""
     pool = await get_db_pool()
-    async with pool.acquire() as conn:
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         rows = await conn.fetch(
             "SELECT deck_id, name, created_by, created_at, public_description FROM decks WHERE is_public = TRUE ORDER BY created_at DESC"
         )
-    decks = [dict(r) for r in rows]
 
     # Also pass the user's managed guilds so the template can populate adopt select
-    managed_guilds = await get_user_managed_guilds(user.get('access_token', ''))
+    managed_guilds = await get_request_managed_guilds(request, user)
     return templates.TemplateResponse("marketplace.html", {
         "request": request,
         "user": user,
-        "decks": decks,
+        "decks": rows,
         "managed_guilds": managed_guilds
     })
 
@@ -584,34 +993,27 @@ async def marketplace(request: Request, user = Depends(require_auth)):
 async def set_deck_public(request: Request, deck_id: int, is_public: int = Form(0), public_description: str = Form(""), user = Depends(require_admin)):
     """Toggle public visibility for a deck (owner or global admin only)"""
     pool = await get_db_pool()
-    async with pool.acquire() as conn:
-        deck = await conn.fetchrow("SELECT created_by FROM decks WHERE deck_id = $1", deck_id)
-        if not deck:
-            raise HTTPException(status_code=404, detail="Deck not found")
-        if deck['created_by'] != user['id'] and not is_global_admin(user['id']):
-            raise HTTPException(status_code=403, detail="You don't own this deck")
+    await require_deck_owner(deck_id, user)
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         await conn.execute(
             "UPDATE decks SET is_public = $1, public_description = $2 WHERE deck_id = $3",
             bool(is_public), public_description or None, deck_id
         )
-    return RedirectResponse(url=f"/deck/{deck_id}/edit", status_code=303)
+    return redirect_to_deck_editor(deck_id)
 
 # Adopt a public deck into a managed server (reference model - no duplication)
 @app.post("/marketplace/{deck_id}/adopt")
-async def adopt_deck(deck_id: int, guild_id: int = Form(...), user = Depends(require_admin)):
+async def adopt_deck(request: Request, deck_id: int, guild_id: int = Form(...), user = Depends(require_admin)):
     """
     Adopt a public deck by creating a reference link to the server.
     No duplication - all servers using this deck share the same canonical deck.
     Only the deck creator can edit; adopters can view and use the deck.
     """
     # Verify user manages the target guild
-    managed_guilds = await get_user_managed_guilds(user.get('access_token',''))
-    guild_ids = [int(g['id']) for g in managed_guilds]
-    if guild_id not in guild_ids and not is_global_admin(user['id']):
-        raise HTTPException(status_code=403, detail="You don't manage this server")
+    await require_guild_manager(request, guild_id, user)
 
     pool = await get_db_pool()
-    async with pool.acquire() as conn:
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         # Verify the deck exists and is public
         public_deck = await conn.fetchrow(
             "SELECT deck_id, name FROM decks WHERE deck_id = $1 AND is_public = TRUE",
@@ -632,7 +1034,7 @@ async def adopt_deck(deck_id: int, guild_id: int = Form(...), user = Depends(req
 async def view_deck(request: Request, deck_id: int, user = Depends(require_auth)):
     """View-only page for browsing deck contents (for public decks, owned decks, or adopted decks)"""
     pool = await get_db_pool()
-    async with pool.acquire() as conn:
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         # Get deck info
         deck = await conn.fetchrow(
             """SELECT deck_id, name, created_by, is_public, public_description, free_pack_cooldown_hours
@@ -642,8 +1044,6 @@ async def view_deck(request: Request, deck_id: int, user = Depends(require_auth)
         if not deck:
             raise HTTPException(status_code=404, detail="Deck not found")
         
-        deck = dict(deck)
-        
         # Check if user can view this deck
         can_view = False
         
@@ -661,12 +1061,11 @@ async def view_deck(request: Request, deck_id: int, user = Depends(require_auth)
         
         # Check if user manages a server that has this deck assigned (adopted decks)
         if not can_view:
-            managed_guilds = await get_user_managed_guilds(user.get('access_token', ''))
-            if managed_guilds:
-                guild_ids = [int(g['id']) for g in managed_guilds]
+            guild_ids = await get_request_managed_guild_ids(request, user)
+            if guild_ids:
                 adopted = await conn.fetchval(
                     "SELECT COUNT(*) FROM server_decks WHERE deck_id = $1 AND guild_id = ANY($2)",
-                    deck_id, guild_ids
+                    deck_id, list(guild_ids)
                 )
                 if adopted > 0:
                     can_view = True
@@ -680,7 +1079,6 @@ async def view_deck(request: Request, deck_id: int, user = Depends(require_auth)
                FROM cards WHERE deck_id = $1 ORDER BY rarity, name""",
             deck_id
         )
-        cards_list = [dict(c) for c in cards]
         
         # Get template fields for this deck
         template_fields = await conn.fetch(
@@ -691,21 +1089,18 @@ async def view_deck(request: Request, deck_id: int, user = Depends(require_auth)
         
         # Get field values for all cards
         card_field_values = {}
-        for card in cards_list:
-            field_values = await conn.fetch(
-                """SELECT template_id, field_value FROM card_template_fields WHERE card_id = $1""",
-                card['card_id']
-            )
+        for card in cards:
+            field_values = await conn.fetch(SQL_CARD_FIELD_VALUES, card['card_id'])
             card_field_values[card['card_id']] = {fv['template_id']: fv['field_value'] for fv in field_values}
-        
-        return templates.TemplateResponse("view_deck.html", {
-            "request": request,
-            "user": user,
-            "deck": deck,
-            "cards": cards_list,
-            "template_fields": template_fields,
-            "card_field_values": card_field_values
-        })
+    
+    return templates.TemplateResponse("view_deck.html", {
+        "request": request,
+        "user": user,
+        "deck": deck,
+        "cards": cards,
+        "template_fields": template_fields,
+        "card_field_values": card_field_values
+    })
 
 @app.get("/deck/create", response_class=HTMLResponse)
 async def create_deck_form(request: Request, user = Depends(require_admin)):
@@ -730,7 +1125,8 @@ async def create_deck(
     pool = await get_db_pool()
     form_data = await request.form()
     
-    async with pool.acquire() as conn:
+    # The deck and its defaults are created together or not at all
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn, conn.transaction():
         # Create deck with cooldown
         deck = await conn.fetchrow(
             """INSERT INTO decks (name, created_by, free_pack_cooldown_hours)
@@ -750,12 +1146,11 @@ async def create_deck(
             'Mythic': 1.0
         }
         
-        for rarity, rate in default_rates.items():
-            await conn.execute(
-                """INSERT INTO rarity_ranges (deck_id, rarity, drop_rate)
-                   VALUES ($1, $2, $3)""",
-                deck['deck_id'], rarity, rate
-            )
+        await conn.executemany(
+            """INSERT INTO rarity_ranges (deck_id, rarity, drop_rate)
+               VALUES ($1, $2, $3)""",
+            [(deck['deck_id'], rarity, rate) for rarity, rate in default_rates.items()]
+        )
         
         # Create template fields if provided
         field_names = form_data.getlist('field_names[]')
@@ -763,31 +1158,40 @@ async def create_deck(
         dropdown_options = form_data.getlist('dropdown_options[]')
         is_required = form_data.getlist('is_required[]')
         
+        # Collect the fields as parallel arrays so they go in with one INSERT
+        names, types, options, orders, required = [], [], [], [], []
         for idx, field_name in enumerate(field_names):
             if field_name:  # Skip empty names
-                field_type = field_types[idx] if idx < len(field_types) else 'text'
-                options = dropdown_options[idx] if idx < len(dropdown_options) else None
+                names.append(field_name)
+                types.append(field_types[idx] if idx < len(field_types) else 'text')
+                options.append(dropdown_options[idx] if idx < len(dropdown_options) else None)
+                orders.append(idx)
                 # is_required[] contains '1' for required, '0' for not required
-                required = is_required[idx] == '1' if idx < len(is_required) else False
-                
-                await conn.execute(
-                    """INSERT INTO card_templates 
-                       (deck_id, field_name, field_type, dropdown_options, field_order, is_required)
-                       VALUES ($1, $2, $3, $4, $5, $6)""",
-                    deck['deck_id'], field_name, field_type, options, idx, required
-                )
+                required.append(is_required[idx] == '1' if idx < len(is_required) else False)
+        
+        if names:
+            await conn.execute(
+                """INSERT INTO card_templates 
+                   (deck_id, field_name, field_type, dropdown_options, field_order, is_required)
+                   SELECT $1, u.name, u.type, u.options, u.ord, u.req
+                   FROM unnest($2::text[], $3::text[], $4::text[], $5::int[], $6::bool[])
+                        AS u(name, type, options, ord, req)""",
+                deck['deck_id'], names, types, options, orders, required
+            )
     
-    return RedirectResponse(url=f"/deck/{deck['deck_id']}/edit", status_code=303)
+    cache_deck_owner(deck['deck_id'], user['id'])
+    return redirect_to_deck_editor(deck['deck_id'])
 
 @app.get("/deck/{deck_id}/edit", response_class=HTMLResponse)
 async def edit_deck_form(request: Request, deck_id: int, user = Depends(require_admin)):
     """Show deck editing form (manage cards)"""
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         # Get deck info
         deck = await conn.fetchrow(
-            "SELECT * FROM decks WHERE deck_id = $1",
+            """SELECT deck_id, name, created_by, is_public, public_description
+               FROM decks WHERE deck_id = $1""",
             deck_id
         )
         
@@ -800,7 +1204,8 @@ async def edit_deck_form(request: Request, deck_id: int, user = Depends(require_
         
         # Get template fields for this deck
         template_fields = await conn.fetch(
-            """SELECT * FROM card_templates 
+            """SELECT template_id, field_name, field_type, dropdown_options, is_required
+               FROM card_templates 
                WHERE deck_id = $1 
                ORDER BY field_order""",
             deck_id
@@ -825,29 +1230,22 @@ async def edit_deck_form(request: Request, deck_id: int, user = Depends(require_
         
         # Get cards in this deck with their template field values
         cards = await conn.fetch(
-            """SELECT c.*, 
-                      array_agg(json_build_object(
-                          'template_id', ctf.template_id,
-                          'field_value', ctf.field_value
-                      ) ORDER BY ct.field_order) FILTER (WHERE ctf.template_id IS NOT NULL) as template_values
-               FROM cards c
-               LEFT JOIN card_template_fields ctf ON c.card_id = ctf.card_id
-               LEFT JOIN card_templates ct ON ctf.template_id = ct.template_id
-               WHERE c.deck_id = $1 
-               GROUP BY c.card_id
-               ORDER BY c.rarity, c.name""",
+            """SELECT card_id, name, description, rarity, image_url, height, diameter, thrust
+               FROM cards
+               WHERE deck_id = $1 
+               ORDER BY rarity, name""",
             deck_id
         )
     
-    return templates.TemplateResponse("edit_deck.html", {
+    return etag_response(request, page_template(EDIT_DECK_TEMPLATE).render({
         "request": request,
         "user": user,
         "template_fields": template_fields,
         "number_template_fields": number_template_fields,
         "merge_perks": merge_perks,
-        "deck": dict(deck),
-        "cards": [dict(c) for c in cards]
-    })
+        "deck": deck,
+        "cards": cards
+    }))
 
 @app.post("/deck/{deck_id}/card/add")
 async def add_card_to_deck(
@@ -865,48 +1263,40 @@ async def add_card_to_deck(
     pool = await get_db_pool()
     form_data = await request.form()
     
-    async with pool.acquire() as conn:
-        # Verify deck ownership
-        deck = await conn.fetchrow(
-            "SELECT created_by FROM decks WHERE deck_id = $1",
-            deck_id
-        )
-        
-        if not deck:
-            raise HTTPException(status_code=404, detail="Deck not found")
-        
-        if deck['created_by'] != user['id'] and not is_global_admin(user['id']):
-            raise HTTPException(status_code=403, detail="You don't own this deck")
-        
-        # Insert card with basic fields and merge configuration
-        card = await conn.fetchrow(
-            """INSERT INTO cards (deck_id, name, description, rarity, image_url, created_by, mergeable, max_merge_level)
-               VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-               RETURNING card_id""",
-            deck_id, name, description, rarity, image_url, user['id'], mergeable, max_merge_level
-        )
-        
-        # Get template fields for this deck
-        template_fields = await conn.fetch(
-            "SELECT template_id FROM card_templates WHERE deck_id = $1",
-            deck_id
-        )
-        
-        # Insert template field values
-        for template_field in template_fields:
-            template_id = template_field['template_id']
-            field_key = f"template_field_{template_id}"
-            
-            if field_key in form_data:
-                field_value = form_data.get(field_key)
-                if field_value:  # Only insert non-empty values
-                    await conn.execute(
-                        """INSERT INTO card_template_fields (card_id, template_id, field_value)
-                           VALUES ($1, $2, $3)""",
-                        card['card_id'], template_id, field_value
+    # Non-empty template field values, keyed by template_id. The insert below
+    # only keeps ids that belong to this deck's templates.
+    provided = {
+        template_id: value
+        for template_id, value in template_field_values(form_data).items()
+        if value
+    }
+    
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        # Insert the card and its template field values if the user owns the deck
+        result = await conn.fetchrow(
+            """WITH d AS (SELECT created_by FROM decks WHERE deck_id = $1),
+                    inserted AS (
+                        INSERT INTO cards (deck_id, name, description, rarity, image_url, created_by, mergeable, max_merge_level)
+                        SELECT $1, $2, $3, $4, $5, $6, $7, $8
+                        WHERE EXISTS (SELECT 1 FROM d WHERE created_by = $6 OR $9)
+                        RETURNING card_id
+                    ),
+                    field_values AS (
+                        INSERT INTO card_template_fields (card_id, template_id, field_value)
+                        SELECT inserted.card_id, ct.template_id, u.field_value
+                        FROM inserted
+                        CROSS JOIN unnest($10::bigint[], $11::text[]) AS u(template_id, field_value)
+                        JOIN card_templates ct ON ct.template_id = u.template_id AND ct.deck_id = $1
                     )
+               SELECT EXISTS (SELECT 1 FROM d) AS deck_found,
+                      (SELECT created_by FROM d) AS owner""",
+            deck_id, name, description, rarity, image_url, user['id'], mergeable, max_merge_level,
+            is_global_admin(user['id']), list(provided), list(provided.values())
+        )
     
-    return RedirectResponse(url=f"/deck/{deck_id}/edit", status_code=303)
+    check_guarded_write(result, deck_id, user)
+    
+    return redirect_to_deck_editor(deck_id)
 
 @app.post("/deck/{deck_id}/card/{card_id}/delete")
 async def delete_card_from_deck(
@@ -918,26 +1308,23 @@ async def delete_card_from_deck(
     """Delete a card from a deck"""
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
-        # Verify deck ownership
-        deck = await conn.fetchrow(
-            "SELECT created_by FROM decks WHERE deck_id = $1",
-            deck_id
-        )
-        
-        if not deck:
-            raise HTTPException(status_code=404, detail="Deck not found")
-        
-        if deck['created_by'] != user['id'] and not is_global_admin(user['id']):
-            raise HTTPException(status_code=403, detail="You don't own this deck")
-        
-        # Delete card
-        await conn.execute(
-            "DELETE FROM cards WHERE card_id = $1 AND deck_id = $2",
-            card_id, deck_id
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        # Delete card if the user owns the deck
+        result = await conn.fetchrow(
+            """WITH d AS (SELECT created_by FROM decks WHERE deck_id = $1),
+                    deleted AS (
+                        DELETE FROM cards
+                        WHERE card_id = $2 AND deck_id = $1
+                          AND EXISTS (SELECT 1 FROM d WHERE created_by = $3 OR $4)
+                    )
+               SELECT EXISTS (SELECT 1 FROM d) AS deck_found,
+                      (SELECT created_by FROM d) AS owner""",
+            deck_id, card_id, user['id'], is_global_admin(user['id'])
         )
     
-    return RedirectResponse(url=f"/deck/{deck_id}/edit", status_code=303)
+    check_guarded_write(result, deck_id, user)
+    
+    return redirect_to_deck_editor(deck_id)
 
 @app.post("/deck/{deck_id}/merge_perk/add")
 async def add_merge_perk(
@@ -954,33 +1341,27 @@ async def add_merge_perk(
     if base_boost < 0.1 or base_boost > 100:
         raise HTTPException(status_code=400, detail="Base boost must be between 0.1 and 100")
     
-    async with pool.acquire() as conn:
-        # Verify deck ownership
-        deck = await conn.fetchrow(
-            "SELECT created_by FROM decks WHERE deck_id = $1",
-            deck_id
-        )
-        
-        if not deck:
-            raise HTTPException(status_code=404, detail="Deck not found")
-        
-        if deck['created_by'] != user['id'] and not is_global_admin(user['id']):
-            raise HTTPException(status_code=403, detail="You don't own this deck")
-        
-        # Insert merge perk (using default diminishing_factor of 0.85)
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        # Insert merge perk (using default diminishing_factor of 0.85) if the user owns the deck
         try:
-            await conn.execute(
-                """INSERT INTO deck_merge_perks (deck_id, perk_name, base_boost, diminishing_factor)
-                   VALUES ($1, $2, $3, 0.85)""",
-                deck_id, perk_name, base_boost
+            result = await conn.fetchrow(
+                """WITH d AS (SELECT created_by FROM decks WHERE deck_id = $1),
+                        inserted AS (
+                            INSERT INTO deck_merge_perks (deck_id, perk_name, base_boost, diminishing_factor)
+                            SELECT $1, $2, $3, 0.85
+                            WHERE EXISTS (SELECT 1 FROM d WHERE created_by = $4 OR $5)
+                        )
+                   SELECT EXISTS (SELECT 1 FROM d) AS deck_found,
+                          (SELECT created_by FROM d) AS owner""",
+                deck_id, perk_name, base_boost, user['id'], is_global_admin(user['id'])
             )
-        except Exception as e:
+        except asyncpg.UniqueViolationError:
             # Handle duplicate perk name
-            if 'duplicate key' in str(e).lower():
-                raise HTTPException(status_code=400, detail=f"Merge perk '{perk_name}' already exists for this deck")
-            raise
+            raise HTTPException(status_code=400, detail=f"Merge perk '{perk_name}' already exists for this deck")
     
-    return RedirectResponse(url=f"/deck/{deck_id}/edit", status_code=303)
+    check_guarded_write(result, deck_id, user)
+    
+    return redirect_to_deck_editor(deck_id)
 
 @app.post("/deck/{deck_id}/merge_perk/{perk_name}/delete")
 async def delete_merge_perk(
@@ -992,37 +1373,31 @@ async def delete_merge_perk(
     """Delete a merge perk from a deck"""
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
-        # Verify deck ownership
-        deck = await conn.fetchrow(
-            "SELECT created_by FROM decks WHERE deck_id = $1",
-            deck_id
-        )
-        
-        if not deck:
-            raise HTTPException(status_code=404, detail="Deck not found")
-        
-        if deck['created_by'] != user['id'] and not is_global_admin(user['id']):
-            raise HTTPException(status_code=403, detail="You don't own this deck")
-        
-        # Delete merge perk
-        await conn.execute(
-            "DELETE FROM deck_merge_perks WHERE deck_id = $1 AND perk_name = $2",
-            deck_id, perk_name
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        # Delete merge perk if the user owns the deck
+        result = await conn.fetchrow(
+            """WITH d AS (SELECT created_by FROM decks WHERE deck_id = $1),
+                    deleted AS (
+                        DELETE FROM deck_merge_perks
+                        WHERE deck_id = $1 AND perk_name = $2
+                          AND EXISTS (SELECT 1 FROM d WHERE created_by = $3 OR $4)
+                    )
+               SELECT EXISTS (SELECT 1 FROM d) AS deck_found,
+                      (SELECT created_by FROM d) AS owner""",
+            deck_id, perk_name, user['id'], is_global_admin(user['id'])
         )
     
-    return RedirectResponse(url=f"/deck/{deck_id}/edit", status_code=303)
+    check_guarded_write(result, deck_id, user)
+    
+    return redirect_to_deck_editor(deck_id)
 
 @app.get("/deck/{deck_id}/activities", response_class=HTMLResponse)
 async def list_card_activities(request: Request, deck_id: int, user = Depends(require_admin)):
     """List all card activities (mission templates) for a deck"""
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
-        deck = await conn.fetchrow(
-            "SELECT * FROM decks WHERE deck_id = $1",
-            deck_id
-        )
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        deck = await conn.fetchrow(SQL_DECK_BY_ID, deck_id)
         
         if not deck:
             raise HTTPException(status_code=404, detail="Deck not found")
@@ -1031,7 +1406,9 @@ async def list_card_activities(request: Request, deck_id: int, user = Depends(re
             raise HTTPException(status_code=403, detail="You don't own this deck")
         
         activities = await conn.fetch(
-            """SELECT * FROM mission_templates 
+            """SELECT mission_template_id, name, description, activity_type, requirement_field,
+                      min_value_base, reward_base, duration_base_hours, variance_pct, is_active
+               FROM mission_templates 
                WHERE deck_id = $1 
                ORDER BY created_at DESC""",
             deck_id
@@ -1040,8 +1417,8 @@ async def list_card_activities(request: Request, deck_id: int, user = Depends(re
     return templates.TemplateResponse("card_activities.html", {
         "request": request,
         "user": user,
-        "deck": dict(deck),
-        "activities": [dict(a) for a in activities]
+        "deck": deck,
+        "activities": activities
     })
 
 @app.get("/deck/{deck_id}/activity/new", response_class=HTMLResponse)
@@ -1049,11 +1426,8 @@ async def new_card_activity(request: Request, deck_id: int, user = Depends(requi
     """Show form to create a new card activity"""
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
-        deck = await conn.fetchrow(
-            "SELECT * FROM decks WHERE deck_id = $1",
-            deck_id
-        )
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        deck = await conn.fetchrow(SQL_DECK_BY_ID, deck_id)
         
         if not deck:
             raise HTTPException(status_code=404, detail="Deck not found")
@@ -1062,7 +1436,7 @@ async def new_card_activity(request: Request, deck_id: int, user = Depends(requi
             raise HTTPException(status_code=403, detail="You don't own this deck")
         
         numeric_fields = await conn.fetch(
-            """SELECT * FROM card_templates 
+            """SELECT field_name FROM card_templates 
                WHERE deck_id = $1 AND field_type = 'number'
                ORDER BY field_order""",
             deck_id
@@ -1071,9 +1445,9 @@ async def new_card_activity(request: Request, deck_id: int, user = Depends(requi
     return templates.TemplateResponse("edit_activity.html", {
         "request": request,
         "user": user,
-        "deck": dict(deck),
+        "deck": deck,
         "activity": None,
-        "numeric_fields": [dict(f) for f in numeric_fields],
+        "numeric_fields": numeric_fields,
         "rarity_scaling": None
     })
 
@@ -1096,18 +1470,10 @@ async def create_card_activity(
     pool = await get_db_pool()
     form_data = await request.form()
     
-    async with pool.acquire() as conn:
-        deck = await conn.fetchrow(
-            "SELECT created_by FROM decks WHERE deck_id = $1",
-            deck_id
-        )
-        
-        if not deck:
-            raise HTTPException(status_code=404, detail="Deck not found")
-        
-        if deck['created_by'] != user['id'] and not is_global_admin(user['id']):
-            raise HTTPException(status_code=403, detail="You don't own this deck")
-        
+    # Verify deck ownership
+    await require_deck_owner(deck_id, user)
+    
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         async with conn.transaction():
             result = await conn.fetchrow(
                 """INSERT INTO mission_templates 
@@ -1142,11 +1508,8 @@ async def edit_card_activity(request: Request, deck_id: int, mission_template_id
     """Show form to edit a card activity"""
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
-        deck = await conn.fetchrow(
-            "SELECT * FROM decks WHERE deck_id = $1",
-            deck_id
-        )
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        deck = await conn.fetchrow(SQL_DECK_BY_ID, deck_id)
         
         if not deck:
             raise HTTPException(status_code=404, detail="Deck not found")
@@ -1155,7 +1518,9 @@ async def edit_card_activity(request: Request, deck_id: int, mission_template_id
             raise HTTPException(status_code=403, detail="You don't own this deck")
         
         activity = await conn.fetchrow(
-            "SELECT * FROM mission_templates WHERE mission_template_id = $1 AND deck_id = $2",
+            """SELECT mission_template_id, name, description, activity_type, requirement_field,
+                      min_value_base, reward_base, duration_base_hours, variance_pct, is_active
+               FROM mission_templates WHERE mission_template_id = $1 AND deck_id = $2""",
             mission_template_id, deck_id
         )
         
@@ -1163,24 +1528,25 @@ async def edit_card_activity(request: Request, deck_id: int, mission_template_id
             raise HTTPException(status_code=404, detail="Activity not found")
         
         numeric_fields = await conn.fetch(
-            """SELECT * FROM card_templates 
+            """SELECT field_name FROM card_templates 
                WHERE deck_id = $1 AND field_type = 'number'
                ORDER BY field_order""",
             deck_id
         )
         
         scaling_rows = await conn.fetch(
-            "SELECT * FROM mission_rarity_scaling WHERE mission_template_id = $1",
+            """SELECT rarity, requirement_multiplier, reward_multiplier, duration_multiplier
+               FROM mission_rarity_scaling WHERE mission_template_id = $1""",
             mission_template_id
         )
-        rarity_scaling = {row['rarity']: dict(row) for row in scaling_rows}
+        rarity_scaling = {row['rarity']: row for row in scaling_rows}
     
     return templates.TemplateResponse("edit_activity.html", {
         "request": request,
         "user": user,
-        "deck": dict(deck),
-        "activity": dict(activity),
-        "numeric_fields": [dict(f) for f in numeric_fields],
+        "deck": deck,
+        "activity": activity,
+        "numeric_fields": numeric_fields,
         "rarity_scaling": rarity_scaling
     })
 
@@ -1204,24 +1570,16 @@ async def update_card_activity(
     pool = await get_db_pool()
     form_data = await request.form()
     
-    async with pool.acquire() as conn:
-        deck = await conn.fetchrow(
-            "SELECT created_by FROM decks WHERE deck_id = $1",
-            deck_id
-        )
-        
-        if not deck:
-            raise HTTPException(status_code=404, detail="Deck not found")
-        
-        if deck['created_by'] != user['id'] and not is_global_admin(user['id']):
-            raise HTTPException(status_code=403, detail="You don't own this deck")
-        
-        activity = await conn.fetchrow(
-            "SELECT * FROM mission_templates WHERE mission_template_id = $1 AND deck_id = $2",
+    # Verify deck ownership
+    await require_deck_owner(deck_id, user)
+    
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        activity_found = await conn.fetchval(
+            "SELECT 1 FROM mission_templates WHERE mission_template_id = $1 AND deck_id = $2",
             mission_template_id, deck_id
         )
         
-        if not activity:
+        if not activity_found:
             raise HTTPException(status_code=404, detail="Activity not found")
         
         async with conn.transaction():
@@ -1265,18 +1623,10 @@ async def delete_card_activity(
     """Delete a card activity (mission template)"""
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
-        deck = await conn.fetchrow(
-            "SELECT created_by FROM decks WHERE deck_id = $1",
-            deck_id
-        )
-        
-        if not deck:
-            raise HTTPException(status_code=404, detail="Deck not found")
-        
-        if deck['created_by'] != user['id'] and not is_global_admin(user['id']):
-            raise HTTPException(status_code=403, detail="You don't own this deck")
-        
+    # Verify deck ownership
+    await require_deck_owner(deck_id, user)
+    
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         await conn.execute(
             "DELETE FROM mission_templates WHERE mission_template_id = $1 AND deck_id = $2",
             mission_template_id, deck_id
@@ -1289,12 +1639,9 @@ async def edit_card_form(request: Request, deck_id: int, card_id: int, user = De
     """Show card editing form"""
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         # Get deck info
-        deck = await conn.fetchrow(
-            "SELECT * FROM decks WHERE deck_id = $1",
-            deck_id
-        )
+        deck = await conn.fetchrow(SQL_DECK_BY_ID, deck_id)
         
         if not deck:
             raise HTTPException(status_code=404, detail="Deck not found")
@@ -1305,7 +1652,8 @@ async def edit_card_form(request: Request, deck_id: int, card_id: int, user = De
         
         # Get card info
         card = await conn.fetchrow(
-            "SELECT * FROM cards WHERE card_id = $1 AND deck_id = $2",
+            """SELECT card_id, name, rarity, description, image_url, mergeable, max_merge_level
+               FROM cards WHERE card_id = $1 AND deck_id = $2""",
             card_id, deck_id
         )
         
@@ -1314,31 +1662,28 @@ async def edit_card_form(request: Request, deck_id: int, card_id: int, user = De
         
         # Get template fields for this deck
         template_fields = await conn.fetch(
-            """SELECT * FROM card_templates 
+            """SELECT template_id, field_name, field_type, dropdown_options, is_required
+               FROM card_templates 
                WHERE deck_id = $1 
                ORDER BY field_order""",
             deck_id
         )
         
         # Get existing field values for this card
-        field_values_rows = await conn.fetch(
-            """SELECT template_id, field_value 
-               FROM card_template_fields 
-               WHERE card_id = $1""",
-            card_id
-        )
+        field_values_rows = await conn.fetch(SQL_CARD_FIELD_VALUES, card_id)
         
-        # Convert to dictionary for easy lookup
-        field_values = {row['template_id']: row['field_value'] for row in field_values_rows}
+        # Convert to dictionary for easy lookup (rows are (template_id, field_value) pairs)
+        field_values = dict(field_values_rows)
     
-    return templates.TemplateResponse("edit_card.html", {
+    # asyncpg Records support the same key access as dicts in templates
+    return HTMLResponse(page_template(EDIT_CARD_TEMPLATE).render({
         "request": request,
         "user": user,
-        "deck": dict(deck),
-        "card": dict(card),
+        "deck": deck,
+        "card": card,
         "template_fields": template_fields,
         "field_values": field_values
-    })
+    }))
 
 @app.post("/deck/{deck_id}/card/{card_id}/update")
 async def update_card(
@@ -1361,98 +1706,69 @@ async def update_card(
     if not mergeable:
         max_merge_level = 0
     
-    async with pool.acquire() as conn:
-        # Verify deck ownership
-        deck = await conn.fetchrow(
-            "SELECT created_by FROM decks WHERE deck_id = $1",
-            deck_id
-        )
-        
-        if not deck:
-            raise HTTPException(status_code=404, detail="Deck not found")
-        
-        if deck['created_by'] != user['id'] and not is_global_admin(user['id']):
-            raise HTTPException(status_code=403, detail="You don't own this deck")
-        
-        # Verify card belongs to this deck
-        card = await conn.fetchrow(
-            "SELECT card_id FROM cards WHERE card_id = $1 AND deck_id = $2",
-            card_id, deck_id
-        )
-        
-        if not card:
-            raise HTTPException(status_code=404, detail="Card not found in this deck")
-        
-        # Normalize blank image_url to NULL
-        if image_url == '':
-            image_url = None
-        
+    # Verify deck ownership
+    await require_deck_owner(deck_id, user)
+    
+    # Normalize blank image_url to NULL
+    if image_url == '':
+        image_url = None
+    
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         # Use transaction to ensure atomicity
         async with conn.transaction():
-            # Update card basic fields
-            await conn.execute(
+            # Update card basic fields (matching no row means the card isn't in this deck)
+            status = await conn.execute(
                 """UPDATE cards 
                    SET name = $1, description = $2, rarity = $3, image_url = $4, 
                        mergeable = $5, max_merge_level = $6
-                   WHERE card_id = $7""",
-                name, description, rarity, image_url, mergeable, max_merge_level, card_id
+                   WHERE card_id = $7 AND deck_id = $8""",
+                name, description, rarity, image_url, mergeable, max_merge_level, card_id, deck_id
             )
             
+            if status == "UPDATE 0":
+                raise HTTPException(status_code=404, detail="Card not found in this deck")
+            
             # Get template fields for this deck
-            template_fields = await conn.fetch(
-                "SELECT template_id FROM card_templates WHERE deck_id = $1",
-                deck_id
-            )
+            template_fields = await conn.fetch(SQL_DECK_TEMPLATE_IDS, deck_id)
             
-            # Update template field values
-            for template_field in template_fields:
-                template_id = template_field['template_id']
-                field_key = f"template_field_{template_id}"
-                
-                if field_key in form_data:
-                    field_value = form_data.get(field_key)
-                    
-                    # Check if value already exists
-                    existing = await conn.fetchrow(
-                        """SELECT field_value FROM card_template_fields 
-                           WHERE card_id = $1 AND template_id = $2""",
-                        card_id, template_id
-                    )
-                    
-                    if field_value:  # Update or insert non-empty values
-                        if existing:
-                            await conn.execute(
-                                """UPDATE card_template_fields 
-                                   SET field_value = $1 
-                                   WHERE card_id = $2 AND template_id = $3""",
-                                field_value, card_id, template_id
-                            )
-                        else:
-                            await conn.execute(
-                                """INSERT INTO card_template_fields (card_id, template_id, field_value)
-                                   VALUES ($1, $2, $3)""",
-                                card_id, template_id, field_value
-                            )
-                    elif existing:  # Delete empty values
-                        await conn.execute(
-                            """DELETE FROM card_template_fields 
-                               WHERE card_id = $1 AND template_id = $2""",
-                            card_id, template_id
-                        )
+            # Submitted template field values, keyed by template_id
+            provided = template_field_values(form_data)
+            submitted = [
+                (template_field['template_id'], provided[template_field['template_id']])
+                for template_field in template_fields
+                if template_field['template_id'] in provided
+            ]
+            
+            # Upsert non-empty values, delete cleared ones
+            upserts = [(card_id, template_id, field_value) for template_id, field_value in submitted if field_value]
+            cleared = [template_id for template_id, field_value in submitted if not field_value]
+            
+            if upserts:
+                await conn.executemany(
+                    """INSERT INTO card_template_fields (card_id, template_id, field_value)
+                       VALUES ($1, $2, $3)
+                       ON CONFLICT (card_id, template_id)
+                       DO UPDATE SET field_value = EXCLUDED.field_value""",
+                    upserts
+                )
+            
+            if cleared:
+                await conn.execute(
+                    """DELETE FROM card_template_fields 
+                       WHERE card_id = $1 AND template_id = ANY($2::int[])""",
+                    card_id, cleared
+                )
     
-    return RedirectResponse(url=f"/deck/{deck_id}/edit", status_code=303)
+    return redirect_to_deck_editor(deck_id)
 
 @app.get("/deck/{deck_id}/cooldown", response_class=HTMLResponse)
 async def edit_cooldown(request: Request, deck_id: int, user = Depends(require_admin)):
     """Show cooldown editor"""
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         # Get deck info
-        deck = await conn.fetchrow(
-            "SELECT * FROM decks WHERE deck_id = $1",
-            deck_id
-        )
+        deck = await conn.fetchrow(SQL_DECK_BY_ID, deck_id)
         
         if not deck:
             raise HTTPException(status_code=404, detail="Deck not found")
@@ -1461,11 +1777,11 @@ async def edit_cooldown(request: Request, deck_id: int, user = Depends(require_a
         if deck['created_by'] != user['id'] and not is_global_admin(user['id']):
             raise HTTPException(status_code=403, detail="You don't own this deck")
     
-    return templates.TemplateResponse("edit_cooldown.html", {
+    return HTMLResponse(page_template(EDIT_COOLDOWN_TEMPLATE).render({
         "request": request,
         "user": user,
-        "deck": dict(deck)
-    })
+        "deck": deck
+    }))
 
 @app.post("/deck/{deck_id}/cooldown/update")
 async def update_cooldown(
@@ -1481,38 +1797,32 @@ async def update_cooldown(
     
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
-        # Verify deck ownership
-        deck = await conn.fetchrow(
-            "SELECT created_by FROM decks WHERE deck_id = $1",
-            deck_id
-        )
-        
-        if not deck:
-            raise HTTPException(status_code=404, detail="Deck not found")
-        
-        if deck['created_by'] != user['id'] and not is_global_admin(user['id']):
-            raise HTTPException(status_code=403, detail="You don't own this deck")
-        
-        # Update cooldown
-        await conn.execute(
-            "UPDATE decks SET free_pack_cooldown_hours = $1 WHERE deck_id = $2",
-            free_pack_cooldown_hours, deck_id
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        # Update cooldown if the user owns the deck
+        result = await conn.fetchrow(
+            """WITH d AS (SELECT created_by FROM decks WHERE deck_id = $1),
+                    updated AS (
+                        UPDATE decks SET free_pack_cooldown_hours = $2
+                        WHERE deck_id = $1
+                          AND EXISTS (SELECT 1 FROM d WHERE created_by = $3 OR $4)
+                    )
+               SELECT EXISTS (SELECT 1 FROM d) AS deck_found,
+                      (SELECT created_by FROM d) AS owner""",
+            deck_id, free_pack_cooldown_hours, user['id'], is_global_admin(user['id'])
         )
     
-    return RedirectResponse(url=f"/deck/{deck_id}/edit", status_code=303)
+    check_guarded_write(result, deck_id, user)
+    
+    return redirect_to_deck_editor(deck_id)
 
 @app.get("/deck/{deck_id}/rarity", response_class=HTMLResponse)
 async def edit_rarity_rates(request: Request, deck_id: int, user = Depends(require_admin)):
     """Show rarity rate editor"""
     pool = await get_db_pool()
     
-    async with pool.acquire() as conn:
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
         # Get deck info
-        deck = await conn.fetchrow(
-            "SELECT * FROM decks WHERE deck_id = $1",
-            deck_id
-        )
+        deck = await conn.fetchrow(SQL_DECK_BY_ID, deck_id)
         
         if not deck:
             raise HTTPException(status_code=404, detail="Deck not found")
@@ -1523,16 +1833,16 @@ async def edit_rarity_rates(request: Request, deck_id: int, user = Depends(requi
         
         # Get rarity rates
         rates = await conn.fetch(
-            "SELECT * FROM rarity_ranges WHERE deck_id = $1 ORDER BY rarity",
+            "SELECT rarity, drop_rate FROM rarity_ranges WHERE deck_id = $1 ORDER BY rarity",
             deck_id
         )
     
-    return templates.TemplateResponse("edit_rarity.html", {
+    return HTMLResponse(page_template(EDIT_RARITY_TEMPLATE).render({
         "request": request,
         "user": user,
-        "deck": dict(deck),
-        "rates": [dict(r) for r in rates]
-    })
+        "deck": deck,
+        "rates": rates
+    }))
 
 @app.post("/deck/{deck_id}/rarity/update")
 async def update_rarity_rates(
@@ -1545,43 +1855,37 @@ async def update_rarity_rates(
     form_data = await request.form()
     
     # Parse rates from form
+    rate_fields = [(key[5:], value) for key, value in form_data.items() if key.startswith('rate_')]
     rates = {}
-    for key, value in form_data.items():
-        if key.startswith('rate_'):
-            rarity = key.replace('rate_', '')
-            try:
-                rates[rarity] = float(value)
-            except ValueError:
-                raise HTTPException(status_code=400, detail=f"Invalid rate for {rarity}")
-    
-    # Validate total = 100
-    total = sum(rates.values())
+    try:
+        for rarity, value in rate_fields:
+            rates[rarity] = float(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid rate for {rarity}")
+    
+    # Validate total = 100 (fsum avoids float drift across the tiers)
+    total = math.fsum(rates.values())
     if abs(total - 100.0) > 0.01:
         raise HTTPException(status_code=400, detail=f"Rates must total 100% (current: {total}%)")
     
-    async with pool.acquire() as conn:
-        # Verify deck ownership
-        deck = await conn.fetchrow(
-            "SELECT created_by FROM decks WHERE deck_id = $1",
-            deck_id
+    async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        # Upsert all rates in one statement if the user owns the deck
+        result = await conn.fetchrow(
+            """WITH d AS (SELECT created_by FROM decks WHERE deck_id = $1),
+                    upserted AS (
+                        INSERT INTO rarity_ranges (deck_id, rarity, drop_rate)
+                        SELECT $1, u.rarity, u.drop_rate
+                        FROM unnest($2::text[], $3::float8[]) AS u(rarity, drop_rate)
+                        WHERE EXISTS (SELECT 1 FROM d WHERE created_by = $4 OR $5)
+                        ON CONFLICT (deck_id, rarity) 
+                        DO UPDATE SET drop_rate = EXCLUDED.drop_rate
+                    )
+               SELECT EXISTS (SELECT 1 FROM d) AS deck_found,
+                      (SELECT created_by FROM d) AS owner""",
+            deck_id, list(rates), list(rates.values()), user['id'], is_global_admin(user['id'])
         )
-        
-        if not deck:
-            raise HTTPException(status_code=404, detail="Deck not found")
-        
-        if deck['created_by'] != user['id'] and not is_global_admin(user['id']):
-            raise HTTPException(status_code=403, detail="You don't own this deck")
-        
-        # Update rates
-        async with conn.transaction():
-            for rarity, rate in rates.items():
-                await conn.execute(
-                    """INSERT INTO rarity_ranges (deck_id, rarity, drop_rate)
-                       VALUES ($1, $2, $3)
-                       ON CONFLICT (deck_id, rarity) 
-                       DO UPDATE SET drop_rate = $3""",
-                    deck_id, rarity, rate
-                )
+    
+    check_guarded_write(result, deck_id, user)
     
     return RedirectResponse(url=f"/deck/{deck_id}/rarity?success=1", status_code=303)
 
@@ -1595,7 +1899,16 @@ import uvicorn
 
 if __name__ == "__main__":
     # port = int(os.environ.get("PORT", 8000))  # Railway injects this
-    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8000)))
+    # Workers need an import string; WEB_CONCURRENCY is uvicorn's own env var for the count.
+    # "auto" picks uvloop and httptools when installed (uvloop isn't on Windows).
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", 8000)),
+        loop="auto",
+        http="auto",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
 
 @app.get("/ping")
 def ping():
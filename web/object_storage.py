@@ -3,51 +3,79 @@ Replit Object Storage Service
 Handles image uploads and retrieval using Google Cloud Storage
 """
 import os
+import re
+import time
 import uuid
-from datetime import datetime, timedelta
-from google.cloud import storage
-from google.cloud.storage import Blob
-from google.auth import external_account
+import asyncio
 import httpx
+import orjson
 from typing import Optional
 
 REPLIT_SIDECAR_ENDPOINT = "http://127.0.0.1:1106"
 
+# Bucket and object name of a storage.googleapis.com URL, ignoring the query string
+GCS_URL_PATTERN = re.compile(r"https://storage\.googleapis\.com/([^/?]+)/([^?]*)")
+
+# Prefix of the image paths stored in the database
+IMAGE_PATH_PREFIX = "/images/card-images/"
+
+UPLOAD_URL_TTL = 900  # 15 minutes
+READ_URL_TTL = 3600  # 1 hour
+
+
+def _expires_at(ttl_sec: int) -> str:
+    """ISO 8601 UTC timestamp ttl_sec from now, for sidecar expires_at"""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + ttl_sec))
+
+
 class ObjectStorageService:
     """Service for interacting with Replit's object storage"""
     
     def __init__(self):
         # Check if PRIVATE_OBJECT_DIR is set first
-        if not os.getenv("PRIVATE_OBJECT_DIR"):
+        private_dir = os.getenv("PRIVATE_OBJECT_DIR")
+        if not private_dir:
             raise ValueError(
                 "PRIVATE_OBJECT_DIR not set. Create a bucket in Replit's Object Storage "
                 "tool and set PRIVATE_OBJECT_DIR secret to your bucket path (e.g., /bucket-name)"
             )
         
-        # For now, we'll use the sidecar endpoint directly for signing URLs
-        # The client initialization is deferred until needed
-        self.client = None
+        # Environment doesn't change at runtime, so resolve the directory
+        # and the card image prefix once instead of on every call
+        self._private_dir = private_dir
+        self._card_prefix = f"{private_dir.rstrip('/')}/card-images/"
+        
+        # All storage access goes through URLs signed by the sidecar, so no
+        # blocking GCS client runs on the event loop. One HTTP client for all
+        # sidecar calls lets signing requests reuse a kept-alive connection;
+        # the pool is sized for a full batch of upload URLs signed at once
+        self._http = httpx.AsyncClient(
+            base_url=REPLIT_SIDECAR_ENDPOINT,
+            timeout=10.0,
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=50,
+                keepalive_expiry=60
+            )
+        )
+    
+    async def aclose(self):
+        """Close the sidecar HTTP client"""
+        await self._http.aclose()
     
     def get_private_object_dir(self) -> str:
         """Get the private object directory from environment"""
-        dir_path = os.getenv("PRIVATE_OBJECT_DIR", "")
-        if not dir_path:
-            raise ValueError(
-                "PRIVATE_OBJECT_DIR not set. Create a bucket in 'Object Storage' "
-                "tool and set PRIVATE_OBJECT_DIR env var."
-            )
-        return dir_path
+        return self._private_dir
     
-    async def get_upload_url(self, file_extension: str = "") -> str:
+    async def get_upload_url(
+        self,
+        file_extension: str = "",
+        expires_at: Optional[str] = None
+    ) -> str:
         """Generate a presigned upload URL for image uploads"""
-        private_dir = self.get_private_object_dir()
-        object_id = str(uuid.uuid4())
-        
-        # Add file extension if provided
-        if file_extension:
-            object_id = f"{object_id}{file_extension}"
-        
-        full_path = f"{private_dir}/card-images/{object_id}"
+        # Object ID is the undashed UUID plus the file extension, if provided
+        object_id = f"{uuid.uuid4().hex}{file_extension}"
+        full_path = f"{self._card_prefix}{object_id}"
         bucket_name, object_name = self._parse_object_path(full_path)
         
         # Get presigned URL from Replit sidecar
@@ -55,48 +83,45 @@ class ObjectStorageService:
             bucket_name=bucket_name,
             object_name=object_name,
             method="PUT",
-            ttl_sec=900  # 15 minutes
+            expires_at=expires_at or _expires_at(UPLOAD_URL_TTL)
         )
         
         return signed_url
     
+    async def get_upload_urls(self, count: int, file_extension: str = "") -> list[str]:
+        """Generate several presigned upload URLs, signed concurrently"""
+        # One expiry for the whole batch
+        expires_at = _expires_at(UPLOAD_URL_TTL)
+        return await asyncio.gather(
+            *(self.get_upload_url(file_extension, expires_at) for _ in range(count))
+        )
+    
     def get_image_path(self, upload_url: str) -> str:
         """
         Convert upload URL to image path that can be stored in database
         Format: /images/card-images/{uuid}
         """
-        private_dir = self.get_private_object_dir()
-        if not private_dir.endswith("/"):
-            private_dir = f"{private_dir}/"
-        
-        # Extract object name from GCS URL
-        if upload_url.startswith("https://storage.googleapis.com/"):
-            # Parse the URL to get the object path
-            parts = upload_url.split("?")[0].split("/")
-            # Find where the bucket name starts (after storage.googleapis.com/)
-            bucket_start_idx = parts.index("storage.googleapis.com") + 1
-            bucket_name = parts[bucket_start_idx]
-            object_name = "/".join(parts[bucket_start_idx + 1:])
-            
+        # Extract bucket and object name from GCS URL
+        match = GCS_URL_PATTERN.match(upload_url)
+        if match:
             # Reconstruct full path
-            full_path = f"/{bucket_name}/{object_name}"
+            full_path = f"/{match[1]}/{match[2]}"
             
             # Extract the card-images part
-            if f"{private_dir}card-images/" in full_path:
-                image_id = full_path.split(f"{private_dir}card-images/")[1]
-                return f"/images/card-images/{image_id}"
+            _, found, image_id = full_path.partition(self._card_prefix)
+            if found:
+                return f"{IMAGE_PATH_PREFIX}{image_id}"
         
         return upload_url
     
     async def get_image_url(self, image_path: str) -> Optional[str]:
         """Get a signed URL for reading an image"""
-        if not image_path.startswith("/images/card-images/"):
+        if not image_path.startswith(IMAGE_PATH_PREFIX):
             return None
         
         # Extract image ID from path
-        image_id = image_path.replace("/images/card-images/", "")
-        private_dir = self.get_private_object_dir()
-        full_path = f"{private_dir}/card-images/{image_id}"
+        image_id = image_path[len(IMAGE_PATH_PREFIX):]
+        full_path = f"{self._card_prefix}{image_id}"
         
         bucket_name, object_name = self._parse_object_path(full_path)
         
@@ -105,23 +130,18 @@ class ObjectStorageService:
             bucket_name=bucket_name,
             object_name=object_name,
             method="GET",
-            ttl_sec=3600  # 1 hour
+            expires_at=_expires_at(READ_URL_TTL)
         )
         
         return signed_url
     
     def _parse_object_path(self, path: str) -> tuple[str, str]:
         """Parse object path into bucket name and object name"""
-        if not path.startswith("/"):
-            path = f"/{path}"
-        
-        parts = path.split("/")
-        if len(parts) < 3:
+        # Split off the bucket only; the rest of the path is the object name
+        bucket_name, sep, object_name = path.removeprefix("/").partition("/")
+        if not sep:
             raise ValueError("Invalid path: must contain at least a bucket name")
         
-        bucket_name = parts[1]
-        object_name = "/".join(parts[2:])
-        
         return bucket_name, object_name
     
     async def _sign_object_url(
@@ -129,11 +149,9 @@ class ObjectStorageService:
         bucket_name: str,
         object_name: str,
         method: str,
-        ttl_sec: int
+        expires_at: str
     ) -> str:
         """Get signed URL from Replit sidecar"""
-        expires_at = (datetime.utcnow() + timedelta(seconds=ttl_sec)).isoformat()
-        
         request_data = {
             "bucket_name": bucket_name,
             "object_name": object_name,
@@ -141,18 +159,17 @@ class ObjectStorageService:
             "expires_at": expires_at
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{REPLIT_SIDECAR_ENDPOINT}/object-storage/signed-object-url",
-                json=request_data,
-                headers={"Content-Type": "application/json"}
+        response = await self._http.post(
+            "/object-storage/signed-object-url",
+            content=orjson.dumps(request_data),
+            headers={"Content-Type": "application/json"}
+        )
+        
+        if response.status_code != 200:
+            raise Exception(
+                f"Failed to sign object URL, status: {response.status_code}, "
+                f"make sure you're running on Replit"
             )
-            
-            if response.status_code != 200:
-                raise Exception(
-                    f"Failed to sign object URL, status: {response.status_code}, "
-                    f"make sure you're running on Replit"
-                )
-            
-            data = response.json()
-            return data["signed_url"]
+        
+        data = orjson.loads(response.content)
+        return data["signed_url"]